@@ -1,5 +1,6 @@
 import datetime as dt
 import logging
+import os
 import time
 
 from dramatiq.brokers.redis import RedisBroker
@@ -13,12 +14,16 @@ import mapper
 
 logger = logging.getLogger(__name__)
 
+# 'orjson' encodes messages with orjson, which needs the optional package
+DRAMATIQ_ENCODER = os.environ.get('DRAMATIQ_ENCODER', 'json')
+ENCODERS = {
+    'json': middleware.TypedEncoder,
+    'orjson': middleware.TypedORJSONEncoder,
+}
 
-broker = RedisBroker(
-    host=redis_client.REDIS_HOST,
-    port=redis_client.REDIS_PORT,
-    db=redis_client.REDIS_DB
-)
+
+# share the one connection pool with the cache and results backend clients
+broker = RedisBroker(connection_pool=redis_client.pool)
 
 
 class Backend(
@@ -31,7 +36,7 @@ class Backend(
 
 def initialize_broker(broker, results_backend=None):
     dramatiq.set_broker(broker)
-    dramatiq.set_encoder(middleware.TypedEncoder())
+    dramatiq.set_encoder(ENCODERS[DRAMATIQ_ENCODER]())
 
     if results_backend:
         results_middleware = dramatiq.results.Results(backend=results_backend)
@@ -62,3 +67,9 @@ def exclusive_actor():
 @mapper.bind_schema
 def now() -> dt.datetime:
     return dt.datetime.now(tz=dt.timezone.utc)
+
+
+@dramatiq.actor(store_results=True)
+@mapper.bind_schema
+def scale(factor: int, value: float) -> float:
+    return factor * value
@@ -5,23 +5,177 @@ import itertools as it
 import inspect
 import json
 import logging
+import os
+import re
+import time
+import uuid
 from typing import (
     Callable,
+    Dict,
     Iterable,
     Optional,
 )
 
+from dramatiq.results.backend import DEFAULT_TIMEOUT
 from dramatiq.results.backends import RedisBackend
 import dramatiq
 
 from redis_client import client
 import mapper
 
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
 logger = logging.getLogger(__name__)
 
+# Every process enqueueing or running actors must hash keys with the same
+# algorithm or cached results and exclusive messages are never matched, so it
+# is pinned here rather than picked by whichever packages are installed.
+# xxh3 is several times faster than md5 on the short inputs hashed into keys.
+DEFAULT_HASHALG = os.environ.get('CACHE_HASHALG', 'xxh3_128')
+
+
+# characters with a special meaning in redis glob patterns
+_GLOB_CHARS = re.compile(r'[\\*?\[\]]')
+
+# Deletes a lock only while it still holds the token of the caller releasing
+# it.  KEYS[1] is the lock key and ARGV[1] the token.
+_RELEASE_LOCK_LUA = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+"""
+
+
+# direct constructors skip the name lookup hashlib.new does on every call
+_HASH_CONSTRUCTORS = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'blake2b': hashlib.blake2b,
+}
+if xxhash is not None:
+    _HASH_CONSTRUCTORS.update({
+        'xxh3_64': xxhash.xxh3_64,
+        'xxh3_128': xxhash.xxh3_128,
+        'xxh64': xxhash.xxh64,
+    })
+elif DEFAULT_HASHALG.startswith('xxh'):
+    raise ImportError(f'CACHE_HASHALG={DEFAULT_HASHALG!r} requires the '
+                      'xxhash package')
+
+
+def _new_hash(hashalg: str):
+    try:
+        return _HASH_CONSTRUCTORS[hashalg]()
+    except KeyError:
+        return hashlib.new(hashalg)
+
+
+def _feed_canonical(h, obj) -> None:
+    """Feed a canonical byte encoding of a JSON-like ``obj`` into the hash
+    ``h`` without building an intermediate JSON string.
+
+    Dictionaries are fed sorted by key and nested strings are length
+    prefixed so that differently shaped containers cannot produce the same
+    byte stream.
+    """
+    if isinstance(obj, dict):
+        h.update(b'{')
+        for key, value in sorted(obj.items()):
+            _feed_canonical(h, key)
+            h.update(b':')
+            _feed_canonical(h, value)
+            h.update(b',')
+        h.update(b'}')
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[')
+        for value in obj:
+            _feed_canonical(h, value)
+            h.update(b',')
+        h.update(b']')
+    elif isinstance(obj, str):
+        data = obj.encode()
+        h.update(b'%d"' % len(data))
+        h.update(data)
+    elif obj is True:
+        h.update(b'true')
+    elif obj is False:
+        h.update(b'false')
+    elif isinstance(obj, int):
+        h.update(b'%d' % obj)
+    elif isinstance(obj, float):
+        h.update(float.__repr__(obj).encode('ascii'))
+    elif obj is None:
+        h.update(b'null')
+    else:
+        raise TypeError(f'Object of type {type(obj).__name__} cannot be '
+                        'used in a cache key')
+
+
+def _feed_value(h, obj) -> None:
+    """Feed a top level cache key object into the hash ``h``.
+
+    Objects are encoded as ``_feed_canonical`` does, bytes length prefixed
+    like strings but tagged apart from them, and each is terminated so that
+    neighbouring objects cannot run into each other.
+    """
+    cls = type(obj)
+    # plain ints, floats and None are by far the most common arguments,
+    # emit them here with the same bytes _feed_canonical would
+    if cls is int:
+        h.update(b'%d,' % obj)
+    elif cls is float:
+        h.update(float.__repr__(obj).encode('ascii'))
+        h.update(b',')
+    elif obj is None:
+        h.update(b'null,')
+    elif isinstance(obj, bytes):
+        h.update(b'%db' % len(obj))
+        h.update(obj)
+        h.update(b',')
+    else:
+        _feed_canonical(h, obj)
+        h.update(b',')
+
+
+def _frame_name(name: str) -> bytes:
+    """Returns the bytes ``_feed_value`` feeds for an argument name"""
+    data = name.encode()
+    return b'%d"%s,' % (len(data), data)
+
+
+class _Scratch(list):
+    """Collects the bytes of one object so they only reach the hash once the
+    whole object has been encoded"""
+
+    update = list.append
+
+
+def _hash_objects(iterable: Iterable, hashalg: str, ignore_errors: bool):
+    h = _new_hash(hashalg)
+    if not ignore_errors:
+        for obj in iterable:
+            _feed_value(h, obj)
+        return h
+
+    # an unhashable value nested in a container is only found after part of
+    # the container was encoded, so each object is encoded separately first
+    for obj in iterable:
+        scratch = _Scratch()
+        try:
+            _feed_value(scratch, obj)
+        except (TypeError, ValueError):
+            continue
+        h.update(b''.join(scratch))
+    return h
+
 
 def generate_key(prefix: str, iterable: Iterable, *,
-                 hashalg: str = 'md5',
+                 hashalg: str = DEFAULT_HASHALG,
                  sep: str = ':',
                  ignore_errors: bool = False) -> str:
     """Generate a cache key for use with Redis of the form:
@@ -32,26 +186,18 @@ def generate_key(prefix: str, iterable: Iterable, *,
     of related keys in Redis.
 
     The bounded arguments are filled with defaults.  Arguments that are
-    not JSON serializable need to be excluded or ``ignore_errors`` set
-    to True.
+    not JSON-like (dicts, lists, tuples, strings, numbers, booleans and
+    ``None``) need to be excluded or ``ignore_errors`` set to True.
 
     :param prefix: unhashed prefix of the cache key
-    :param iterable: JSON serializable objects to use in the hash key
-    :param hashalg: optional different hash algorithm to use
+    :param iterable: JSON-like objects to use in the hash key
+    :param hashalg: optional different hash algorithm to use, either a
+        ``hashlib`` algorithm or an ``xxhash`` one such as ``'xxh3_128'``
     :param sep: optional alternative separator to use after ``prefix``
-    :param ignore_errors: whether to skip JSON serializing value errors
+    :param ignore_errors: whether to skip objects that cannot be hashed
 
     """
-    h = hashlib.new(hashalg)
-    for obj in iterable:
-        if not isinstance(obj, (bytes, str)):
-            try:
-                obj = json.dumps(obj, sort_keys=True)
-            except ValueError:
-                if not ignore_errors:
-                    raise
-        h.update(obj if isinstance(obj, bytes) else obj.encode())
-
+    h = _hash_objects(iterable, hashalg, ignore_errors)
     return f'{prefix}{sep}{h.hexdigest()}'
 
 
@@ -70,18 +216,125 @@ def signature_key(bound_args: inspect.BoundArguments, prefix: str,
     :param exclude: optional blacklist of arguments to exclude in cache key
     :param generate_kwargs: keyword arguments passed to ``generate_key``
     """
+    objects = _signature_objects(bound_args, only, exclude)
+    return generate_key(prefix, objects, **generate_kwargs)
+
+
+def signature_key_bytes(bound_args: inspect.BoundArguments,
+                        only: Optional[Iterable] = None,
+                        exclude: Optional[Iterable] = None, *,
+                        hashalg: str = DEFAULT_HASHALG,
+                        ignore_errors: bool = False) -> bytes:
+    """Returns the raw digest of the hashed function arguments, the binary
+    counterpart of the hashed part of ``signature_key`` for callers that
+    key Redis with bytes.  At 16 bytes for the default algorithms it is half
+    the length of the hex digest.
+
+    :param bound_args: function signature bounded arguments
+    :param only: optional whitelist of arguments to include in the digest
+    :param exclude: optional blacklist of arguments to exclude in the digest
+    :param hashalg: optional different hash algorithm to use
+    :param ignore_errors: whether to skip objects that cannot be hashed
+    """
+    objects = _signature_objects(bound_args, only, exclude)
+    return _hash_objects(objects, hashalg, ignore_errors).digest()
+
+
+def _signature_objects(bound_args: inspect.BoundArguments,
+                       only: Optional[Iterable],
+                       exclude: Optional[Iterable]) -> Iterable:
     only = None if only is None else set(only)
     exclude = None if exclude is None else set(exclude)
 
     bound_args.apply_defaults()
-    objects = (
+    return (
         obj
         for argname, value in bound_args.arguments.items()
         for obj in [argname, value]
         if (only is None or argname in only)
         and (exclude is None or argname not in exclude)
     )
-    return generate_key(prefix, objects, **generate_kwargs)
+
+
+class _KeyPlan:
+    """Precomputed plan for hashing the arguments of calls to a function.
+
+    Binds call arguments with ``mapper.make_binder``, the same way
+    ``inspect.Signature.bind`` followed by ``apply_defaults`` does, raising
+    ``TypeError`` for calls that do not match the signature.  Keys generated
+    from the plan match the ones ``signature_key`` generates for the same
+    call with the default hash algorithm.
+    """
+
+    __slots__ = (
+        'bind',
+        'included',
+    )
+
+    def __init__(self, signature: inspect.Signature,
+                 only: Optional[Iterable] = None,
+                 exclude: Optional[Iterable] = None):
+        only = None if only is None else set(only)
+        exclude = None if exclude is None else set(exclude)
+        self.bind = mapper.make_binder(signature)
+        self.included = tuple(
+            (name, _frame_name(name)) for name in signature.parameters
+            if (only is None or name in only)
+            and (exclude is None or name not in exclude)
+        )
+
+    def arguments(self, args, kwargs) -> list:
+        """Returns ``(name, value)`` pairs of the included arguments, with
+        defaults applied and names framed as bytes"""
+        arguments = self.bind(args, kwargs)
+        return [(name_bytes, arguments[name])
+                for name, name_bytes in self.included]
+
+    @staticmethod
+    def _hash(arguments: list):
+        # feeds the already framed names straight into the hash
+        h = _new_hash(DEFAULT_HASHALG)
+        for name_bytes, value in arguments:
+            h.update(name_bytes)
+            _feed_value(h, value)
+        return h
+
+    @classmethod
+    def key(cls, prefix: str, arguments: list) -> str:
+        """Generates the same key as ``generate_key`` would for the
+        flattened ``arguments`` pairs"""
+        return f'{prefix}:{cls._hash(arguments).hexdigest()}'
+
+    @classmethod
+    def digest(cls, arguments: list) -> bytes:
+        """Returns the same digest as ``signature_key_bytes`` would for the
+        flattened ``arguments`` pairs"""
+        return cls._hash(arguments).digest()
+
+
+_KEY_PLANS: Dict[Callable, _KeyPlan] = {}
+
+
+def _key_plan(func: Callable) -> _KeyPlan:
+    # signatures never change after declaration so only reflect on func once
+    try:
+        return _KEY_PLANS[func]
+    except KeyError:
+        plan = _KEY_PLANS[func] = _KeyPlan(inspect.signature(func))
+        return plan
+
+
+def call_digest(func: Callable, args, kwargs) -> bytes:
+    """Returns the raw digest of the arguments of a call to ``func``, the
+    same digest ``signature_key_bytes`` returns for the bound call, without
+    binding an ``inspect.BoundArguments``.
+
+    :param func: the function called, its signature is reflected on once
+    :param args: positional arguments of the call
+    :param kwargs: keyword arguments of the call
+    """
+    plan = _key_plan(func)
+    return plan.digest(plan.arguments(args, kwargs))
 
 
 def memoized(func: Optional[Callable] = None, *,
@@ -109,14 +362,12 @@ def memoized(func: Optional[Callable] = None, *,
         if prefix is None:
             prefix = func.__name__
         schema = mapper.BoundSchema(func, mapper=type_mapper)
+        plan = _KeyPlan(schema.signature, only=only, exclude=exclude)
 
         @fn.wraps(func)
         def wrapper(*args, **kwargs):
             ser_args, ser_kwargs = schema.serialize_arguments(*args, **kwargs)
-            key = signature_key(
-                schema.signature.bind(*ser_args, **ser_kwargs), prefix,
-                only=only, exclude=exclude,
-            )
+            key = plan.key(prefix, plan.arguments(ser_args, ser_kwargs))
             result = client.get(key)
             if result is None:
                 result = func(*args, **kwargs)
@@ -135,35 +386,97 @@ def memoized(func: Optional[Callable] = None, *,
 
 class CacheBackendMixin:
 
+    # the last message a key was built for and its key.  A direct call to a
+    # cached actor looks its result up, locks and stores it with the one
+    # message, which is immutable, so its key is only built once.
+    _last_key = (None, None)
+
     def build_message_key(self, message) -> str:
+        last_message, message_key = self._last_key
+        if last_message is message:
+            return message_key
+
         broker = dramatiq.get_broker()
         actor = broker.get_actor(message.actor_name)
-        signature = inspect.signature(actor.fn)
-        # even though .bind() will sort any declared keyword arguments, if the
-        # actor.fn accepts any **kwargs then this ensures that those are sorted
-        # in the final bound args as well
-        kwargs = {k: v for k, v in sorted(message.kwargs.items())}
+        plan = _key_plan(actor.fn)
+        # no need to sort message.kwargs, declared arguments are bound in
+        # signature order and any **kwargs dict is hashed with sorted keys
         try:
-            bound_args = signature.bind(*message.args, **kwargs)
+            arguments = plan.arguments(message.args, message.kwargs)
         except TypeError:
             raise TypeError('Cannot cache partial messages')
-        message_key = signature_key(bound_args, message.actor_name)
+        message_key = plan.key(message.actor_name, arguments)
+        self._last_key = (message, message_key)
         return message_key
 
     def get_result(self, message, *, block=False, timeout=None):
-        try:
-            return super().get_result(message, block=block, timeout=timeout)
-        except TypeError:
-            # TypeError will occur when this message is partial
-            if message.options.get('pipe_source') is None:
-                raise
-        # attempt to build the full key from the pipeline source results
-        source_message = dramatiq.Message(**message.options['pipe_source'])
-        source_result = self.get_result(source_message, block=block,
-                                        timeout=timeout)
-        full_args = tuple(it.chain(message.args, [source_result]))
-        full_message = message.copy(args=full_args)
-        return self.get_result(full_message, block=block, timeout=timeout)
+        # the key of a partial pipeline message depends on the result of its
+        # source message, so walk back to the first complete message in the
+        # pipeline then fetch each result forwards from there.  Fetching a
+        # partial message fails building its key before reaching redis.
+        partials = []
+        while True:
+            try:
+                result = super().get_result(message, block=block,
+                                            timeout=timeout)
+                break
+            except TypeError:
+                # TypeError will occur when this message is partial
+                source = message.options.get('pipe_source')
+                if source is None:
+                    raise
+            if not partials:
+                if timeout is None:
+                    timeout = DEFAULT_TIMEOUT
+                # blocking waits for every message share the one timeout
+                deadline = time.monotonic() + timeout / 1000
+            partials.append(message)
+            message = dramatiq.Message(**source)
+
+        for partial in reversed(partials):
+            # the worker passed the next message the deserialized result
+            result = self.deserialize_result(message, result)
+            full_args = tuple(it.chain(partial.args, [result]))
+            message = partial.copy(args=full_args)
+            remaining = max(0, deadline - time.monotonic()) * 1000
+            result = super().get_result(message, block=block,
+                                        timeout=remaining)
+        return result
+
+    def deserialize_result(self, message, result):
+        """Returns the result of ``message`` as the actor returned it.
+        Results are stored as is by default, backends that serialize them
+        override this."""
+        return result
+
+    def invalidate(self, actor_name: str, *, count: int = 1000) -> int:
+        """Deletes every cached result of ``actor_name`` and returns the
+        number of results deleted.
+
+        Keys are matched with an incremental ``SCAN`` rather than ``KEYS`` so
+        Redis is never blocked walking the whole keyspace at once, and are
+        deleted in batches with ``UNLINK`` which frees memory in the
+        background.
+
+        :param actor_name: name of the actor to delete the results of
+        :param count: number of keys to scan and delete per batch
+        """
+        # glob characters in the name are escaped and the digest matched by
+        # its exact length, so names such as 'a' cannot match the keys of
+        # other actors such as 'a*' or 'a:b'
+        name = _GLOB_CHARS.sub(r'\\\g<0>', actor_name)
+        digest_length = 2 * _new_hash(DEFAULT_HASHALG).digest_size
+        pattern = f'{name}:{"?" * digest_length}'
+        deleted = 0
+        batch = []
+        for key in self.client.scan_iter(match=pattern, count=count):
+            batch.append(key)
+            if len(batch) >= count:
+                deleted += self.client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += self.client.unlink(*batch)
+        return deleted
 
 
 class CacheBackend(CacheBackendMixin, RedisBackend):
@@ -187,39 +500,101 @@ class pipeline(dramatiq.pipeline):
             else:
                 messages.append(child)
 
-        # The msg.copy() is important here. It serves several functions.
+        # The message.copy() is important here. It serves several functions.
         # 1. It prevents addions to message from altering the source messages.
         # 2. Those unaltered messages are the ones that need to be used for
         # pipe_target and pipe_source in order to prevent circular references
         # when executing the pipeline.
-        prev_msg = None
-        for n, message in enumerate(msg.copy() for msg in messages):
-            with suppress(IndexError):
-                next_msg = messages[n + 1]
-                message.options['pipe_target'] = next_msg.asdict()
-            if prev_msg:
-                message.options['pipe_source'] = prev_msg.asdict()
+        # Each source message is only converted to a dict once since it is
+        # both the pipe_target of one message and pipe_source of another.
+        asdicts = [message.asdict() for message in messages]
+        last = len(messages) - 1
+        for n, message in enumerate(messages):
+            message = message.copy()
+            if n < last:
+                message.options['pipe_target'] = asdicts[n + 1]
+            if n > 0:
+                message.options['pipe_source'] = asdicts[n - 1]
             self.messages.append(message)
-            prev_msg = messages[n]
 
 
 class CachedActorMixin:
     """Uses existing results middleware backends to store the result when the
     actor is called directly"""
 
+    #: milliseconds a direct call holds the lock that makes concurrent calls
+    #: with the same arguments wait for its result instead of recomputing it
+    lock_ttl = 30000
+    #: milliseconds a waiting call blocks for the result before checking
+    #: whether the lock was released without one, also bounding how long it
+    #: holds a pooled connection.  Redis blocks in whole seconds so shorter
+    #: intervals are raised to one second rather than polling redis.
+    lock_wait_interval = 1000
+
+    # the broker the results middleware was last found on and the middleware,
+    # cached to avoid scanning the middleware every call.  Misses are not
+    # cached since the middleware can be added to the broker later.
+    _results = (None, None)
+    # shared by every instance, registered on first use
+    _release_script = None
+
+    def _get_results_middleware(self, broker):
+        cached_broker, results = self._results
+        if cached_broker is not broker:
+            results = next((
+                middleware for middleware in broker.middleware
+                if isinstance(middleware, dramatiq.results.Results)
+            ), None)
+            if results is not None:
+                self._results = (broker, results)
+        return results
+
+    def _release_lock(self, client, key: str, token: str) -> bool:
+        """Deletes the lock ``key`` only if it still holds ``token``, so a
+        call outliving its lock never releases the lock of another call"""
+        if CachedActorMixin._release_script is None:
+            CachedActorMixin._release_script = \
+                client.register_script(_RELEASE_LOCK_LUA)
+        return bool(self._release_script(keys=[key], args=[token],
+                                         client=client))
+
     def __call__(self, *args, **kwargs):
         message = self.message(*args, **kwargs)
         with suppress(dramatiq.results.errors.ResultMissing):
             return message.get_result()
 
-        result = super().__call__(*args, **kwargs)
-        broker = dramatiq.get_broker()
-        for middleware in broker.middleware:
-            if not isinstance(middleware, dramatiq.results.Results):
-                continue
-            middleware.backend
-            result_ttl = self.options.get('result_ttl', middleware.result_ttl)
-            middleware.backend.store_result(message, result, result_ttl)
+        results = self._get_results_middleware(dramatiq.get_broker())
+        if results is None:
+            return super().__call__(*args, **kwargs)
+
+        # only one caller computes a missing result, concurrent callers with
+        # the same arguments wait for it to be stored instead.  Waiting callers
+        # take the lock over if its holder fails without storing a result,
+        # and compute the result themselves once the lock would have expired.
+        backend = results.backend
+        client = getattr(backend, 'client', None)
+        token = None
+        if client is not None:
+            key = f'lock:{backend.build_message_key(message)}'
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + self.lock_ttl / 1000
+            while not client.set(key, token, nx=True, px=self.lock_ttl):
+                if time.monotonic() >= deadline:
+                    token = None
+                    break
+                with suppress(dramatiq.results.errors.ResultTimeout):
+                    return message.get_result(
+                        block=True,
+                        timeout=max(1000, self.lock_wait_interval),
+                    )
+
+        try:
+            result = super().__call__(*args, **kwargs)
+            result_ttl = self.options.get('result_ttl', results.result_ttl)
+            backend.store_result(message, result, result_ttl)
+        finally:
+            if token is not None:
+                self._release_lock(client, key, token)
         return result
 
 
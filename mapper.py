@@ -37,6 +37,106 @@ CORE_MAP = OrderedDict({
 })
 
 
+# integer codes for inspect.Parameter kinds, cheaper to compare per argument
+# than the enum members looked up through inspect.Parameter
+POSITIONAL_ONLY = int(inspect.Parameter.POSITIONAL_ONLY)
+POSITIONAL_OR_KEYWORD = int(inspect.Parameter.POSITIONAL_OR_KEYWORD)
+VAR_POSITIONAL = int(inspect.Parameter.VAR_POSITIONAL)
+KEYWORD_ONLY = int(inspect.Parameter.KEYWORD_ONLY)
+VAR_KEYWORD = int(inspect.Parameter.VAR_KEYWORD)
+
+
+def make_binder(signature: inspect.Signature) -> t.Callable:
+    """Returns a function binding ``(args, kwargs)`` to an ordered dict of
+    every parameter's argument with defaults applied, like
+    ``signature.bind`` followed by ``apply_defaults`` does but without
+    building an ``inspect.BoundArguments``, raising ``TypeError`` when the
+    arguments do not match.
+
+    Signatures made only of positional or keyword parameters, by far the
+    most common for actors, get a binder specialized to them.  Only the
+    binding is specialized, callers still handle each bound argument.
+    """
+    params = tuple(signature.parameters.values())
+    names = tuple(param.name for param in params)
+    kinds = tuple(int(param.kind) for param in params)
+    defaults = tuple(param.default for param in params)
+    nparams = len(params)
+    empty = inspect.Parameter.empty
+
+    if any(kind != POSITIONAL_OR_KEYWORD for kind in kinds):
+        return _make_general_binder(names, kinds, defaults)
+
+    def bind(args, kwargs):
+        nargs = len(args)
+        if nargs == nparams and not kwargs:
+            return dict(zip(names, args))
+        if nargs > nparams:
+            raise TypeError('too many positional arguments')
+        arguments = dict(zip(names, args))
+        used = 0
+        for index in range(nargs, nparams):
+            name = names[index]
+            if name in kwargs:
+                arguments[name] = kwargs[name]
+                used += 1
+            elif defaults[index] is not empty:
+                arguments[name] = defaults[index]
+            else:
+                raise TypeError(f'missing a required argument: {name!r}')
+        if used != len(kwargs):
+            unexpected = ', '.join(repr(name) for name in kwargs
+                                   if name not in names[nargs:])
+            raise TypeError(f'got multiple values or unexpected keyword '
+                            f'arguments: {unexpected}')
+        return arguments
+
+    return bind
+
+
+def _make_general_binder(names, kinds, defaults) -> t.Callable:
+    # binds signatures with positional only, variadic or keyword only
+    # parameters, which the specialized binder does not handle
+    empty = inspect.Parameter.empty
+    max_positional = sum(kind < VAR_POSITIONAL for kind in kinds)
+    var_positional = VAR_POSITIONAL in kinds
+    keywords = frozenset(
+        name for name, kind in zip(names, kinds)
+        if kind == POSITIONAL_OR_KEYWORD or kind == KEYWORD_ONLY
+    )
+    params = tuple(enumerate(zip(names, kinds, defaults)))
+
+    def bind(args, kwargs):
+        nargs = len(args)
+        if nargs > max_positional and not var_positional:
+            raise TypeError('too many positional arguments')
+        arguments = {}
+        used = 0
+        for index, (name, kind, default) in params:
+            if kind == VAR_POSITIONAL:
+                value = tuple(args[max_positional:])
+            elif kind == VAR_KEYWORD:
+                value = {k: v for k, v in kwargs.items() if k not in keywords}
+                used += len(value)
+            elif kind != KEYWORD_ONLY and index < nargs:
+                if kind != POSITIONAL_ONLY and name in kwargs:
+                    raise TypeError(f'multiple values for argument {name!r}')
+                value = args[index]
+            elif kind != POSITIONAL_ONLY and name in kwargs:
+                value = kwargs[name]
+                used += 1
+            elif default is not empty:
+                value = default
+            else:
+                raise TypeError(f'missing a required argument: {name!r}')
+            arguments[name] = value
+        if used != len(kwargs):
+            raise TypeError('got an unexpected keyword argument')
+        return arguments
+
+    return bind
+
+
 def bind_schema(function=None, *, mapper=None):
     def decorator(function):
         setattr(function, 'schema', BoundSchema(function, mapper=mapper))
@@ -49,7 +149,13 @@ def bind_schema(function=None, *, mapper=None):
 
 
 class FieldMapper:
-    __slots__ = ('stdtyping_map', 'core_map', 'fields_options')
+    __slots__ = (
+        '_core_fields',
+        '_core_types',
+        'core_map',
+        'fields_options',
+        'stdtyping_map',
+    )
 
     def __init__(self, stdtyping_map=None, core_map=None, **fields_options):
         """Declares a mapping from any annotation object to a marshmallow
@@ -64,15 +170,25 @@ class FieldMapper:
         self.stdtyping_map = stdtyping_map or STDTYPING_MAP
         self.core_map = core_map or CORE_MAP
         self.fields_options = fields_options
+        # the core map is fixed once the mapper is declared, so the types
+        # tuple and the field resolved for each class only need computing once
+        self._core_types = tuple(self.core_map.keys())
+        self._core_fields = {}
 
     def is_core_type(self, typex):
         if isinstance(typex, type):
-            return issubclass(typex, tuple(self.core_map.keys()))
+            return issubclass(typex, self._core_types)
         return False
 
     def core_to_field(self, core: type):
+        try:
+            return self._core_fields[core]
+        except KeyError:
+            pass
+
         for core_type, field_type in self.core_map.items():
             if issubclass(core, core_type):
+                self._core_fields[core] = field_type
                 return field_type
 
         raise ValueError(f'{core} type is not supported')
@@ -153,6 +269,8 @@ class BoundSchema:
     # serialize and deserialize respectively
 
     __slots__ = (
+        '_bind',
+        '_plan',
         'args',
         'fn',
         'mapper',
@@ -168,6 +286,24 @@ class BoundSchema:
         for name, param in signature.parameters.items():
             self.args[name] = self._parameter_to_field(param)
         self.result = self.mapper.to_field(signature.return_annotation)
+        # bound field methods per parameter so the ser/de loops do not look
+        # up the field and its methods for every argument of every call.
+        # Bound arguments with defaults applied hold every parameter in
+        # signature order, so the plan is iterated in lockstep with them.
+        self._plan = tuple(
+            (name, int(param.kind), self.args[name].serialize,
+             self.args[name].deserialize, self._field_validator(name))
+            for name, param in signature.parameters.items()
+        )
+        self._bind = make_binder(signature)
+
+    def _field_validator(self, name):
+        field = self.args[name]
+        if callable(getattr(field, 'validate', None)):
+            return field.validate
+        elif callable(getattr(field, '_validate', None)):
+            return field._validate
+        return None
 
     def _parameter_to_field(self, param):
         options = {}
@@ -178,52 +314,44 @@ class BoundSchema:
         return self.mapper.to_field(param.annotation, **options)
 
     def serialize_arguments(self, *de_args, **de_kwargs):
-        bound = self.signature.bind(*de_args, **de_kwargs)
-        bound.apply_defaults()
+        arguments = self._bind(de_args, de_kwargs)
         ser_args = []
         ser_kwargs = {}
-        for name, value in bound.arguments.items():
-            ser_value = self.args[name].serialize(attr=name,
-                                                  obj=bound.arguments)
-            kind = self.signature.parameters[name].kind
-            if kind is inspect.Parameter.POSITIONAL_ONLY:
+        for name, kind, serialize, _deserialize, _validate in self._plan:
+            ser_value = serialize(attr=name, obj=arguments)
+            if kind == POSITIONAL_OR_KEYWORD or kind == KEYWORD_ONLY:
+                ser_kwargs[name] = ser_value
+            elif kind == POSITIONAL_ONLY:
                 ser_args.append(ser_value)
-            elif kind is inspect.Parameter.VAR_POSITIONAL:
+            elif kind == VAR_POSITIONAL:
                 ser_args.extend(ser_value)
-            elif kind is inspect.Parameter.VAR_KEYWORD:
-                ser_kwargs.update(ser_value)
             else:
-                ser_kwargs[name] = ser_value
+                ser_kwargs.update(ser_value)
         return ser_args, ser_kwargs
 
     def deserialize_arguments(self, *ser_args, **ser_kwargs):
-        bound = self.signature.bind(*ser_args, **ser_kwargs)
-        bound.apply_defaults()
+        arguments = self._bind(ser_args, ser_kwargs)
         de_args = []
         de_kwargs = {}
-        for name, value in bound.arguments.items():
-            de_value = self.args[name].deserialize(value=value, attr=name,
-                                                   obj=bound.arguments)
-            kind = self.signature.parameters[name].kind
-            if kind is inspect.Parameter.POSITIONAL_ONLY:
+        for (name, kind, _serialize, deserialize, _validate), value in \
+                zip(self._plan, arguments.values()):
+            de_value = deserialize(value=value, attr=name, obj=arguments)
+            if kind == POSITIONAL_OR_KEYWORD or kind == KEYWORD_ONLY:
+                de_kwargs[name] = de_value
+            elif kind == POSITIONAL_ONLY:
                 de_args.append(de_value)
-            elif kind is inspect.Parameter.VAR_POSITIONAL:
+            elif kind == VAR_POSITIONAL:
                 de_args.extend(de_value)
-            elif kind is inspect.Parameter.VAR_KEYWORD:
-                de_kwargs.update(de_value)
             else:
-                de_kwargs[name] = de_value
+                de_kwargs.update(de_value)
         return de_args, de_kwargs
 
     def validate_arguments(self, *args, **kwargs):
-        bound = self.signature.bind(*args, **kwargs)
-        bound.apply_defaults()
-        for name, value in bound.arguments.items():
-            field = self.args[name]
-            if callable(getattr(field, 'validate', None)):
-                field.validate(value)
-            elif callable(getattr(field, '_validate', None)):
-                field._validate(value)
+        arguments = self._bind(args, kwargs)
+        for (_name, _kind, _serialize, _deserialize, validate), value in \
+                zip(self._plan, arguments.values()):
+            if validate is not None:
+                validate(value)
 
     def serialize_result(self, result):
         return self.result.serialize(attr='result', obj={'result': result})
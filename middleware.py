@@ -1,11 +1,12 @@
-import functools as fn
 import datetime as dt
-import time
-import inspect
+import json
+import logging
+import re
 import threading
-from contextlib import suppress
+import time
 from typing import (
     Any,
+    Dict,
     Optional,
 )
 
@@ -14,12 +15,60 @@ import dramatiq
 import cache
 import mapper
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+logger = logging.getLogger(__name__)
+
 
 TEN_MINS_IN_MS = 600 * 1000
 
 
+# Atomically returns the start time of a matching message still in
+# progress or records the start time of this one, expiring it after the
+# progress timeout.  Times are in milliseconds from the redis server clock
+# so every enqueueing host agrees on them.  KEYS[1] is the message key and
+# ARGV[1] the progress timeout.  Recording is a single SET NX PX, only
+# when a start time already exists is it read and checked against this
+# message's timeout, since a message with a shorter ``max_age`` than the one
+# recorded must not wait for the longer expiry.
+_CHECK_SET_LUA = """
+    redis.replicate_commands()
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(time[2] / 1000)
+    if redis.call('SET', KEYS[1], now, 'NX', 'PX', ARGV[1]) then
+        return false
+    end
+    local started_at = redis.call('GET', KEYS[1])
+    if tonumber(started_at) + tonumber(ARGV[1]) > now then
+        return started_at
+    end
+    redis.call('SET', KEYS[1], now, 'PX', ARGV[1])
+    return false
+"""
+
+
 class AlreadyQueued(dramatiq.middleware.SkipMessage):
-    pass
+    """Raised when enqueueing an exclusive message while a matching message
+    is in progress.  The description is only formatted when displayed.
+
+    :param message: the message that was not enqueued
+    :param started_at: when the matching message was enqueued, in seconds
+        since the epoch
+    """
+
+    def __init__(self, message, started_at: float):
+        super().__init__(message, started_at)
+        self.message = message
+        self.started_at = started_at
+
+    def __str__(self):
+        started_datetime = dt.datetime.fromtimestamp(self.started_at)
+        return ('Matching message already queued at '
+                f'{started_datetime}: {self.message.asdict()}')
 
 
 class ProgressMiddleware(dramatiq.Middleware):
@@ -49,70 +98,157 @@ class ProgressMiddleware(dramatiq.Middleware):
     time.sleep(11)
     myactor.send()  # previous run should have completed, runs again
     ```
+
+    Acked messages are released asynchronously.  Their keys are deleted in
+    batches by a background thread, so for up to ``delete_interval`` plus a
+    round trip to redis after a message is acked, sending a matching
+    exclusive message still raises AlreadyQueued.
     """
 
+    # shared by every instance, registered on first use
+    _check_set = None
+
     def __init__(self, client, key_prefix='actor_progress',
-                 progress_timeout=TEN_MINS_IN_MS):
+                 progress_timeout=TEN_MINS_IN_MS, delete_interval=5):
+        """
+        :param client: redis client used to track messages in progress
+        :param key_prefix: prefix of the keys used to track messages
+        :param progress_timeout: milliseconds after which a message in
+            progress no longer blocks matching messages, unless overriden by
+            the message's ``max_age`` option
+        :param delete_interval: milliseconds the keys of acked messages are
+            collected for before being deleted together in one command
+        """
         self.client = client
         self.key_prefix = key_prefix
+        self._key_prefix_bytes = f'{key_prefix}:'.encode()
         self.progress_timeout = progress_timeout
+        self.delete_interval = delete_interval
+        self._delete_keys = []
+        self._delete_condition = threading.Condition()
+        self._deleter = None
 
     @property
     def actor_options(self):
         return {'exclusive'}
 
-    def build_message_key(self, message):
-        broker = dramatiq.get_broker()
+    def build_message_key(self, message, broker=None) -> bytes:
+        # keys end with the raw argument digest rather than its hex form to
+        # halve their size.  The digest is kept in the message options so
+        # acking the message, usually in a worker process, does not rebuild
+        # it, but is always rebuilt here since copies of a message keep its
+        # options with different arguments.
+        if broker is None:
+            broker = dramatiq.get_broker()
         actor = broker.get_actor(message.actor_name)
-        signature = inspect.signature(actor)
-        bound_args = signature.bind(*message.args, **message.kwargs)
-        message_key = cache.signature_key(bound_args, message.actor_name)
-        return f'{self.key_prefix}:{message_key}'
+        digest = cache.call_digest(actor, message.args, message.kwargs)
+        message.options['_progress_digest'] = digest.hex()
+        return self._message_key(message.actor_name, digest)
 
-    def before_enqueue(self, broker, message, delay):
-        enqueue_time = time.time()
-        message_key = self.build_message_key(message)
-
-        def check_key(pipe):
-            started_at = self.client.get(message_key)
-            started_at = None if started_at is None else float(started_at)
-            if started_at is not None and \
-                    enqueue_time < started_at + progress_timeout:
-                started_datetime = dt.datetime.fromtimestamp(started_at)
-                raise AlreadyQueued(
-                    'Matching message already queued at '
-                    f'{started_datetime}: {message.asdict()}'
-                )
-            else:
-                self.client.set(message_key, enqueue_time)
+    def _message_key(self, actor_name: str, digest: bytes) -> bytes:
+        return b''.join((
+            self._key_prefix_bytes, actor_name.encode(), b':', digest,
+        ))
 
-        if message.options.get('exclusive', False):
-            progress_timeout = message.options.get('max_age',
-                                                   self.progress_timeout)
-            self.client.transaction(check_key, message_key)
+    def before_enqueue(self, broker, message, delay):
+        options = message.options
+        if not options.get('exclusive', False):
+            return
+
+        message_key = self.build_message_key(message, broker)
+        progress_timeout = options.get('max_age', self.progress_timeout)
+        if ProgressMiddleware._check_set is None:
+            ProgressMiddleware._check_set = \
+                self.client.register_script(_CHECK_SET_LUA)
+        started_at = self._check_set(keys=[message_key],
+                                     args=[int(progress_timeout)],
+                                     client=self.client)
+        if started_at is not None:
+            raise AlreadyQueued(message, float(started_at) / 1000)
 
     def before_ack(self, broker, message, *, result=None, exception=None):
-
-        if message.options.get('exclusive', False):
-            message_key = self.build_message_key(message)
-            # self.client.transaction(lambda pipe: pipe.delete(message_key),
-            #                         message_key)
-            self.client.delete(message_key)
+        if not message.options.get('exclusive', False):
+            return
+
+        # the message is acked with the arguments it was enqueued with, so
+        # the digest stored when enqueueing it is still current
+        digest = message.options.get('_progress_digest')
+        if digest is None:
+            message_key = self.build_message_key(message, broker)
+        else:
+            message_key = self._message_key(message.actor_name,
+                                            bytes.fromhex(digest))
+        self._queue_delete(message_key)
+
+    def after_worker_shutdown(self, broker, worker):
+        self.flush_deletes()
+
+    def _queue_delete(self, message_key):
+        # acks only queue their key, a background thread started with the
+        # first ack deletes the queued keys in batches off the worker threads
+        with self._delete_condition:
+            self._delete_keys.append(message_key)
+            if self._deleter is None:
+                self._deleter = threading.Thread(
+                    target=self._delete_loop,
+                    name='progress-middleware-deleter',
+                    daemon=True,
+                )
+                self._deleter.start()
+            self._delete_condition.notify()
+
+    def _delete_loop(self):
+        while True:
+            with self._delete_condition:
+                self._delete_condition.wait_for(lambda: self._delete_keys)
+            # let acks arriving shortly after join the same batch
+            time.sleep(self.delete_interval / 1000)
+            self.flush_deletes()
+
+    def flush_deletes(self):
+        """Deletes the keys of every message acked since the last flush"""
+        with self._delete_condition:
+            keys, self._delete_keys = self._delete_keys, []
+        if not keys:
+            return
+        try:
+            self.client.delete(*keys)
+        except Exception:
+            # the keys still expire after the progress timeout
+            logger.exception('Failed to delete %d progress keys', len(keys))
+
+
+# actors are only declared at import, so the schemas are cached in a plain
+# dict which is cheaper to hit than an lru_cache
+_SCHEMA_CACHE: Dict[str, Optional[mapper.BoundSchema]] = {}
 
 
-@fn.lru_cache(maxsize=100)
 def _get_actor_schema(actor_name: str) -> Optional[mapper.BoundSchema]:
-    with suppress(AttributeError):
-        broker = dramatiq.get_broker()
-        actor = broker.get_actor(actor_name)
-        return actor.fn.schema
+    try:
+        return _SCHEMA_CACHE[actor_name]
+    except KeyError:
+        pass
+
+    actor = dramatiq.get_broker().actors.get(actor_name)
+    if actor is None:
+        # messages can be sent to actors declared in other processes, the
+        # actor may also be declared later so this is not cached
+        return None
+    schema = getattr(actor.fn, 'schema', None)
+    _SCHEMA_CACHE[actor_name] = schema
+    return schema
 
 
 def _get_message_schema(message_data: Any):
     # Despite the type annotations on encode and decode  we can be passed
     # non-MessageData.  Seems to be most common in the Results middleware.
-    with suppress(TypeError, AttributeError):
-        return _get_actor_schema(message_data.actor_name)
+    # Messages are either Message objects or their dict form.
+    actor_name = getattr(message_data, 'actor_name', None)
+    if actor_name is None and isinstance(message_data, dict):
+        actor_name = message_data.get('actor_name')
+    if not isinstance(actor_name, str):
+        return None
+    return _get_actor_schema(actor_name)
 
 
 class TypedEncoderMixin:
@@ -122,20 +258,23 @@ class TypedEncoderMixin:
         if schema is None:
             return super().encode(data)
 
-        output = {**data}
-        args, kwargs = schema.serialize_arguments(*data['args'],
-                                                  **data['kwargs'])
-        output['args'] = args
-        output['kwargs'] = kwargs
-        return super().encode(output)
+        # swap the serialized arguments in rather than copying the message,
+        # restoring the originals since the caller still owns data
+        de_args, de_kwargs = data['args'], data['kwargs']
+        data['args'], data['kwargs'] = \
+            schema.serialize_arguments(*de_args, **de_kwargs)
+        try:
+            return super().encode(data)
+        finally:
+            data['args'], data['kwargs'] = de_args, de_kwargs
 
     def decode(self, data: bytes) -> dramatiq.encoder.MessageData:
         output = super().decode(data)
-        schema = _get_message_schema(data)
+        schema = _get_message_schema(output)
         if schema is None:
             return output
-        args, kwargs = schema.deserialize_arguments(*data['args'],
-                                                    **data['kwargs'])
+        args, kwargs = schema.deserialize_arguments(*output['args'],
+                                                    **output['kwargs'])
         output['args'] = args
         output['kwargs'] = kwargs
         return output
@@ -152,11 +291,70 @@ class TypedResultsBackendMixin:
 
     def get_result(self, message, *, block=False, timeout=None) -> Any:
         result = super().get_result(message, block=block, timeout=timeout)
+        return self.deserialize_result(message, result)
+
+    def deserialize_result(self, message, result: Any) -> Any:
         schema = _get_message_schema(message)
         if schema is not None:
             result = schema.deserialize_result(result)
         return result
 
 
+# integers of 20 digits or more may not fit the 64 bits orjson decodes
+# integers to, orjson decodes them as floats instead
+_WIDE_INT = re.compile(rb'\d{20}')
+
+# orjson natively encodes datetimes, dataclasses and subclasses of the JSON
+# types, these make it refuse them like the json module does
+_ORJSON_OPTIONS = 0 if orjson is None else (
+    orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_PASSTHROUGH_SUBCLASS
+)
+
+
+class ORJSONEncoder(dramatiq.Encoder):
+    """JSON encoder using orjson, which encodes straight to bytes several
+    times faster than the standard library json module.
+
+    Data orjson refuses, such as integers wider than 64 bits or dicts with
+    keys other than strings, is encoded with the json module instead.  Data
+    orjson would decode differently or not at all, such as wide integers or
+    NaN, is decoded with the json module, which raises a ``DecodeError``
+    when it cannot decode the data either.  Unlike the json module orjson
+    still encodes NaN and infinite floats as ``null``, and UUIDs and enums
+    as their values.
+    """
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError('ORJSONEncoder requires the orjson package')
+
+    def encode(self, data: dramatiq.encoder.MessageData) -> bytes:
+        try:
+            return orjson.dumps(data, option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data: bytes) -> dramatiq.encoder.MessageData:
+        if _WIDE_INT.search(data) is None:
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+        # the json module also accepts NaN and infinite floats
+        try:
+            return json.loads(data)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise dramatiq.errors.DecodeError(
+                f'failed to decode message {data!r}', data, e,
+            ) from None
+
+
 class TypedEncoder(TypedEncoderMixin, dramatiq.JSONEncoder):
     pass
+
+
+class TypedORJSONEncoder(TypedEncoderMixin, ORJSONEncoder):
+    """Typed encoder using orjson, for deployments whose messages carry no
+    NaN or infinite floats, UUIDs or enums"""
@@ -6,6 +6,36 @@ import redis
 REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
 REDIS_DB = int(os.environ.get('REDIS_DB', 0))
+# path to a unix socket, preferred over host and port when redis is local
+REDIS_SOCKET = os.environ.get('REDIS_SOCKET')
+# worker threads per process, passed to dramatiq with --threads
+DRAMATIQ_THREADS = int(os.environ.get('DRAMATIQ_THREADS', 8))
+# the broker, results backend and cache share the pool, so every worker
+# thread waiting on a result still leaves connections to fetch and ack with
+REDIS_MAX_CONNECTIONS = int(os.environ.get(
+    'REDIS_MAX_CONNECTIONS', max(32, DRAMATIQ_THREADS * 2),
+))
+REDIS_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30)
+)
 
 
-client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+if REDIS_SOCKET:
+    pool = redis.BlockingConnectionPool(
+        connection_class=redis.UnixDomainSocketConnection,
+        path=REDIS_SOCKET,
+        db=REDIS_DB,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    )
+else:
+    pool = redis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+client = redis.Redis(connection_pool=pool)
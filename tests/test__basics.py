@@ -1,5 +1,6 @@
 import datetime as dt
 import logging
+import threading
 import time
 
 import dramatiq
@@ -7,6 +8,7 @@ import pytest
 
 import actors
 import cache
+import mapper
 import middleware
 
 
@@ -20,8 +22,13 @@ def broker():
 def stub_broker():
     from dramatiq.brokers.stub import StubBroker
     broker = StubBroker()
+    encoder = dramatiq.get_encoder()
     actors.initialize_broker(broker)
     yield broker
+    dramatiq.set_broker(actors.broker)
+    dramatiq.set_encoder(encoder)
+    for actor_name in broker.actors:
+        middleware._SCHEMA_CACHE.pop(actor_name, None)
 
 
 @pytest.fixture
@@ -90,12 +97,98 @@ def test_pipelines_are_cachable(broker, stub_worker):
         'intermediate results should be cached'
 
 
+def test_typed_pipelines_are_cachable(broker, stub_worker):
+    pipe = cache.pipeline([
+        actors.scale.message(2, 2.5),
+        actors.scale.message(3),
+    ])
+    pipe.run()
+    assert pipe.get_result(block=True) == 15.0
+
+    pipe2 = cache.pipeline([
+        actors.scale.message(2, 2.5),
+        actors.scale.message(3),
+    ])
+    result = pipe2.get_result()
+    assert isinstance(result, float)
+    assert result == 15.0, \
+        'should get the result of an identical typed pipeline without running'
+    assert actors.scale.message(3, 5.0).get_result() == 15.0
+
+
 def test_should_cache_direct_call_result(broker, stub_worker):
     result = actors.adder(1, 2)
     cached_result = actors.adder.message(1, 2).get_result()
     assert result == cached_result
 
 
+def _adder_lock_key(a, b):
+    message = actors.adder.message(a, b)
+    return f'lock:{actors.cache_backend.build_message_key(message)}'
+
+
+def test_cached_actor_releases_its_lock(broker):
+    assert actors.adder(1, 2) == 3
+    assert not broker.client.exists(_adder_lock_key(1, 2))
+
+
+def test_cached_actor_waits_for_locked_result(broker):
+    lock_key = _adder_lock_key(1, 2)
+    broker.client.set(lock_key, 'other', px=5000)
+
+    def store():
+        time.sleep(0.5)
+        actors.cache_backend.store_result(actors.adder.message(1, 2), 42,
+                                          ttl=10000)
+
+    thread = threading.Thread(target=store)
+    thread.start()
+    assert actors.adder(1, 2) == 42, 'should wait for the lock holder result'
+    thread.join()
+    assert broker.client.get(lock_key) == b'other'
+
+
+def test_cached_actor_takes_over_released_lock(broker):
+    lock_key = _adder_lock_key(1, 2)
+    broker.client.set(lock_key, 'other', px=5000)
+
+    def release():
+        time.sleep(0.5)
+        broker.client.delete(lock_key)
+
+    thread = threading.Thread(target=release)
+    thread.start()
+    started = time.monotonic()
+    assert actors.adder(1, 2) == 3
+    thread.join()
+    assert time.monotonic() - started < 3, \
+        'should not wait for the released lock to expire'
+    assert not broker.client.exists(lock_key)
+
+
+def test_cached_actor_builds_its_key_once(broker, monkeypatch):
+    built = []
+    key = cache._KeyPlan.key
+
+    def counting_key(prefix, arguments):
+        built.append(prefix)
+        return key(prefix, arguments)
+
+    monkeypatch.setattr(cache._KeyPlan, 'key', staticmethod(counting_key))
+    assert actors.adder(20, 22) == 42
+    assert built == ['adder'], \
+        'the lookup, lock and store should share the one message key'
+
+
+def test_cached_actor_keeps_locks_taken_by_others(broker):
+    lock_key = _adder_lock_key(1, 2)
+    broker.client.set(lock_key, 'other')
+    assert not actors.adder._release_lock(broker.client, lock_key, 'mine')
+    assert broker.client.get(lock_key) == b'other'
+    assert actors.adder._release_lock(broker.client, lock_key, 'other')
+    assert not broker.client.exists(lock_key)
+
+
 def test_progress_middleware(broker, stub_worker, caplog):
     actors.exclusive_actor.send_with_options(exclusive=True)
     with pytest.raises(middleware.AlreadyQueued):
@@ -107,6 +200,56 @@ def test_progress_middleware(broker, stub_worker, caplog):
     actors.exclusive_actor.send_with_options(exclusive=True)
 
 
+def test_progress_middleware_rebuilds_copied_message_keys(broker):
+    message = actors.adder.message_with_options(args=(7, 8), exclusive=True)
+    # the broker enqueues a copy of message, the digest is only stored on it
+    enqueued = broker.enqueue(message)
+    assert '_progress_digest' in enqueued.options
+    # copies keep the options, including the digest of the original args
+    broker.enqueue(enqueued.copy(args=(7, 9)))
+    with pytest.raises(middleware.AlreadyQueued):
+        broker.enqueue(enqueued.copy())
+
+
+class _DeleteRecorder:
+
+    def __init__(self):
+        self.deletes = []
+
+    def delete(self, *keys):
+        self.deletes.append(keys)
+
+
+def _acked_message(digest):
+    return dramatiq.Message(
+        queue_name='default', actor_name='exclusive_actor', args=(),
+        kwargs={}, options={'exclusive': True, '_progress_digest': digest},
+    )
+
+
+def test_progress_middleware_batches_deletes():
+    client = _DeleteRecorder()
+    progress = middleware.ProgressMiddleware(client, delete_interval=50)
+    progress.before_ack(None, _acked_message('00' * 16))
+    progress.before_ack(None, _acked_message('11' * 16))
+    progress.before_ack(None, dramatiq.Message(
+        queue_name='default', actor_name='exclusive_actor', args=(),
+        kwargs={}, options={},
+    ))
+    deadline = time.monotonic() + 2
+    while not client.deletes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    prefix = b'actor_progress:exclusive_actor:'
+    assert client.deletes == [
+        (prefix + bytes(16), prefix + b'\x11' * 16),
+    ], 'acked keys should be deleted together in one command'
+
+    # shutting down deletes the keys still queued without waiting
+    progress.before_ack(None, _acked_message('22' * 16))
+    progress.after_worker_shutdown(None, None)
+    assert client.deletes[1:] == [(prefix + b'\x22' * 16,)]
+
+
 def test_typed_backend():
     message = actors.now.message()
     result = actors.now()
@@ -125,3 +268,53 @@ def test_cache_datetime(broker, stub_worker):
     stub_worker.join()
     result = message1.get_result(block=True, timeout=1000)
     assert isinstance(result, dt.datetime)
+
+
+def test_invalidate_cached_results(broker, stub_worker):
+    actors.adder(5, 6)
+    actors.adder(5, 7)
+    assert actors.adder.message(5, 6).get_result() == 11
+    # keys of other actors whose names share the prefix must survive
+    broker.client.set(f'adder:sub:{"0" * 32}', 1)
+
+    assert actors.cache_backend.invalidate('adde?') == 0
+    assert actors.cache_backend.invalidate('adder') == 2
+    assert broker.client.exists(f'adder:sub:{"0" * 32}')
+    with pytest.raises(dramatiq.results.ResultMissing):
+        actors.adder.message(5, 6).get_result()
+
+
+def test_typed_encoder_round_trip(stub_broker):
+    @dramatiq.actor
+    @mapper.bind_schema
+    def typed_actor(when: dt.datetime) -> dt.datetime:
+        return when
+
+    when = dt.datetime(2019, 1, 1, 13, 30, tzinfo=dt.timezone.utc)
+    message = typed_actor.message(when)
+    encoder = middleware.TypedEncoder()
+    decoded = encoder.decode(encoder.encode(message.asdict()))
+    assert decoded['kwargs'] == {'when': when}
+
+
+def test_results_middleware_lookup_misses_are_not_cached(stub_broker):
+    assert actors.adder._get_results_middleware(stub_broker) is None
+    results = dramatiq.results.Results(backend=actors.cache_backend)
+    stub_broker.add_middleware(results)
+    assert actors.adder._get_results_middleware(stub_broker) is results
+
+
+def test_orjson_encoder_matches_json_encoder():
+    pytest.importorskip('orjson')
+    encoder = middleware.ORJSONEncoder()
+    json_encoder = dramatiq.JSONEncoder()
+    data = {'args': [2 ** 64, {'x': {1: 'a'}}], 'kwargs': {}}
+    expected = json_encoder.decode(json_encoder.encode(data))
+    assert json_encoder.decode(encoder.encode(data)) == expected
+    assert encoder.decode(encoder.encode(data)) == expected
+    with pytest.raises(TypeError):
+        encoder.encode({'when': dt.datetime(2019, 1, 1)})
+    assert encoder.decode(json_encoder.encode({'x': float('inf')})) == \
+        {'x': float('inf')}
+    with pytest.raises(dramatiq.errors.DecodeError):
+        encoder.decode(b'{')
@@ -0,0 +1,86 @@
+import inspect
+
+import pytest
+
+import cache
+
+
+def test_generate_key_ignores_dict_order():
+    key1 = cache.generate_key('prefix', ['a', {'x': 1, 'y': [1, 2.5]}])
+    key2 = cache.generate_key('prefix', ['a', {'y': [1, 2.5], 'x': 1}])
+    assert key1 == key2
+    assert key1.startswith('prefix:')
+
+
+def test_generate_key_distinguishes_nested_strings():
+    assert cache.generate_key('p', [['a,b']]) != \
+        cache.generate_key('p', [['a', 'b']])
+    assert cache.generate_key('p', [[1]]) != cache.generate_key('p', [['1']])
+
+
+def test_generate_key_unhashable_objects():
+    with pytest.raises(TypeError):
+        cache.generate_key('p', [object()])
+    assert cache.generate_key('p', ['a', object()], ignore_errors=True) == \
+        cache.generate_key('p', ['a'])
+    assert cache.generate_key('p', ['a', [1, object()]],
+                              ignore_errors=True) == \
+        cache.generate_key('p', ['a'])
+
+
+def test_generate_key_frames_top_level_values():
+    assert cache.generate_key('p', ['1', 2]) != cache.generate_key('p', [1, 2])
+    assert cache.generate_key('p', [b'1']) != cache.generate_key('p', ['1'])
+    assert cache.generate_key('p', ['a', '1b', 'b', '3']) != \
+        cache.generate_key('p', ['a', '1', 'b', 'b3'])
+    assert cache.generate_key('p', [12, 3]) != cache.generate_key('p', [1, 23])
+
+
+def test_key_plan_matches_signature_key():
+    def fn(a, b=2, *args, c, **kwargs):
+        pass
+
+    signature = inspect.signature(fn)
+    plan = cache._KeyPlan(signature, exclude=['b'])
+    for args, kwargs in [((1,), {'c': 3}), ((1, 2, 3), {'c': 4, 'd': 5})]:
+        expected = cache.signature_key(signature.bind(*args, **kwargs), 'fn',
+                                       exclude=['b'])
+        assert plan.key('fn', plan.arguments(args, kwargs)) == expected
+
+
+def test_key_plan_rejects_partial_calls():
+    def fn(a, b):
+        pass
+
+    plan = cache._KeyPlan(inspect.signature(fn))
+    with pytest.raises(TypeError):
+        plan.arguments((1,), {})
+    with pytest.raises(TypeError):
+        plan.arguments((1, 2), {'c': 3})
+
+
+@pytest.mark.parametrize('obj', (1, -2, 2.5, None, True))
+def test_generate_key_scalars_match_nested(obj):
+    h1 = cache._new_hash(cache.DEFAULT_HASHALG)
+    cache._feed_canonical(h1, obj)
+    h1.update(b',')
+    assert cache.generate_key('p', [obj]) == f'p:{h1.hexdigest()}'
+
+
+def test_signature_key_bytes_matches_signature_key():
+    def fn(a, b=2):
+        pass
+
+    bound_args = inspect.signature(fn).bind(1)
+    digest = cache.signature_key_bytes(bound_args)
+    assert len(digest) == 16
+    assert cache.signature_key(bound_args, 'fn') == f'fn:{digest.hex()}'
+
+
+def test_call_digest_matches_signature_key_bytes():
+    def fn(*args, **kwargs):
+        pass
+
+    bound_args = inspect.signature(fn).bind(1, 'a', b=[1, 2])
+    assert cache.call_digest(fn, (1, 'a'), {'b': [1, 2]}) == \
+        cache.signature_key_bytes(bound_args)
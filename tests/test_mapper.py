@@ -1,4 +1,5 @@
 import datetime as dt
+import inspect
 from collections import deque
 
 from marshmallow import fields
@@ -159,3 +160,50 @@ def test_bind_mixed_args(mixed_fn):
 
 def test_bind_star_args(star_fn):
     assert star_fn('a', 'b', foo='bar') == (('a', 'b'), {'foo': 'bar'})
+
+
+def test_core_to_field_subclass_lookup(default_mapper):
+    class MyDateTime(dt.datetime):
+        pass
+
+    assert default_mapper.is_core_type(MyDateTime)
+    field = default_mapper.core_to_field(MyDateTime)
+    assert field is default_mapper.core_to_field(dt.datetime)
+    assert default_mapper.core_to_field(MyDateTime) is field
+    with pytest.raises(ValueError):
+        default_mapper.core_to_field(object)
+
+
+def test_serialize_arguments_binding_errors(mixed_fn):
+    _ser_args, ser_kwargs = mixed_fn.schema.serialize_arguments(b=2, a='x')
+    assert list(ser_kwargs.items()) == [('a', 'x'), ('b', 2)]
+    with pytest.raises(TypeError):
+        mixed_fn.schema.serialize_arguments()
+    with pytest.raises(TypeError):
+        mixed_fn.schema.serialize_arguments('x', a='y')
+    with pytest.raises(TypeError):
+        mixed_fn.schema.serialize_arguments('x', 1, 2)
+
+
+@pytest.mark.parametrize('args, kwargs', [
+    ((), {}),
+    ((1,), {}),
+    ((1,), {'c': 5}),
+    ((1, 2, 3), {'c': 4, 'z': 6}),
+    ((1,), {'a': 2, 'c': 3}),
+    ((1,), {'c': 3, 'q': 1}),
+])
+def test_make_binder_matches_signature_bind(args, kwargs):
+    def fn(a, b=2, *args, c, d=4, **kwargs):
+        pass
+
+    signature = inspect.signature(fn)
+    try:
+        bound_args = signature.bind(*args, **kwargs)
+    except TypeError:
+        with pytest.raises(TypeError):
+            mapper.make_binder(signature)(args, kwargs)
+        return
+    bound_args.apply_defaults()
+    arguments = mapper.make_binder(signature)(args, kwargs)
+    assert list(arguments.items()) == list(bound_args.arguments.items())